@@ -1,5 +1,5 @@
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain_groq import ChatGroq
@@ -8,13 +8,39 @@ import os
 import re
 import math
 import json
+import threading
 from recipes import filter_recipes, generate_recipe_text
 from recipe_model import recommend_recipes
+import profiling
 
 app = Flask(__name__)
 
 load_dotenv()
 
+# --- On-demand Profiling ---
+# Loaded after load_dotenv() so PROFILE_* values in .env are picked up
+app.config['PROFILING'] = profiling.load_config()
+
+@app.before_request
+def start_profiling():
+    """Start the sampling profiler if this request was flagged or sampled"""
+    config = app.config['PROFILING']
+    if profiling.should_profile(config, request.endpoint, request.headers, request.args):
+        g.profiler = profiling.RequestSampler(threading.get_ident(), config['interval_ms'] / 1000.0).start()
+
+@app.teardown_request
+def stop_profiling(exc):
+    """Stop the sampler and dump the profile once the response has been built"""
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return
+    try:
+        sampler.stop()
+        config = app.config['PROFILING']
+        sampler.dump(request.endpoint, config['dir'], config['formats'])
+    except Exception as e:
+        print(f"Error writing profile: {str(e)}")
+
 # BMI and BMR Calculation Functions
 def calculate_bmi(weight_kg, height_ft):
     """Calculate BMI given weight in kg and height in feet"""
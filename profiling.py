@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+import hmac
+import math
+
+# On-demand request profiling. Everything is driven by environment variables so
+# a running deployment can be profiled by changing its .env and restarting.
+# Settings are read by load_config() rather than at import time, so the caller
+# can run load_dotenv() first.
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_QUERY_ARG = "_profile"
+DEFAULT_DIR = "profiles"
+DEFAULT_INTERVAL_MS = 5.0
+DEFAULT_FORMATS = ["collapsed", "speedscope"]
+KNOWN_FORMATS = {"collapsed", "speedscope"}
+
+
+def parse_sample_rates(spec):
+    """Parse 'endpoint:percent,...' into a dict, e.g. 'generate_recipes:5,*:0.5'"""
+    rates = {}
+    for item in (spec or "").split(","):
+        if ":" not in item:
+            continue
+        endpoint, percent = item.rsplit(":", 1)
+        try:
+            value = float(percent)
+        except ValueError:
+            continue
+        if math.isnan(value):
+            continue
+        rates[endpoint.strip()] = max(0.0, min(100.0, value))
+    return rates
+
+
+def parse_interval_ms(value, default=DEFAULT_INTERVAL_MS):
+    """Parse the sampling interval, falling back to `default` for bad or non-positive values"""
+    try:
+        interval = float(value)
+    except (TypeError, ValueError):
+        return default
+    if not math.isfinite(interval) or interval <= 0:
+        return default
+    return interval
+
+
+def parse_formats(spec, default=DEFAULT_FORMATS):
+    """Parse a comma-separated format list, dropping unknown names and falling back to `default`"""
+    formats = [f.strip() for f in (spec or "").split(",") if f.strip() in KNOWN_FORMATS]
+    return formats or list(default)
+
+
+def load_config(environ=None):
+    """Read the PROFILE_* settings from `environ` (defaults to os.environ)"""
+    environ = os.environ if environ is None else environ
+    return {
+        'token': environ.get("PROFILE_TOKEN", ""),
+        'allow_query': environ.get("PROFILE_ALLOW_QUERY", "").strip().lower() in ("1", "true", "yes"),
+        'dir': environ.get("PROFILE_DIR") or DEFAULT_DIR,
+        'interval_ms': parse_interval_ms(environ.get("PROFILE_INTERVAL_MS")),
+        'formats': parse_formats(environ.get("PROFILE_FORMATS")),
+        'sample_rates': parse_sample_rates(environ.get("PROFILE_SAMPLE_RATES", "")),
+    }
+
+
+def should_profile(config, endpoint, headers, args):
+    """Decide whether the current request gets profiled.
+
+    A request is profiled when it carries the configured token (header, or the
+    query flag if PROFILE_ALLOW_QUERY is set), or when it falls inside the
+    sampling percentage for its endpoint.
+    """
+    token = config.get('token')
+    if token:
+        supplied = headers.get(PROFILE_HEADER) or ""
+        if not supplied and config.get('allow_query'):
+            supplied = args.get(PROFILE_QUERY_ARG) or ""
+        # Compare bytes: compare_digest raises TypeError on non-ASCII str
+        if supplied and hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            return True
+    rates = config.get('sample_rates', {})
+    rate = rates.get(endpoint, rates.get("*", 0.0))
+    return rate > 0 and random.random() * 100 < rate
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestSampler:
+    """Sampling profiler for a single thread.
+
+    A daemon thread wakes every `interval` seconds and records the target
+    thread's current stack, so the profiled request pays almost nothing
+    beyond the occasional GIL hand-off. Each sample is weighted by the time
+    actually elapsed since the previous one, since waiting on the GIL can
+    stretch the gap well past `interval`.
+    """
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL_MS / 1000.0):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.elapsed = {}
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._started_perf = None
+        self._last_sample = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._started_perf = self._last_sample = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started_perf
+        return self
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            gap = now - self._last_sample
+            self._last_sample = now
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack = tuple(reversed(stack))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.elapsed[stack] = self.elapsed.get(stack, 0.0) + gap
+            self.samples += 1
+
+    def collapsed(self):
+        """Return stacks in Brendan Gregg's collapsed format (one 'a;b;c count' per line)"""
+        lines = [";".join(stack) + f" {count}" for stack, count in self.stacks.items()]
+        return "\n".join(sorted(lines)) + "\n"
+
+    def speedscope(self, name):
+        """Return a speedscope 'sampled' profile as a dict"""
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        for stack, seconds in self.elapsed.items():
+            ids = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label})
+                ids.append(index[label])
+            samples.append(ids)
+            weights.append(round(seconds * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "optifit-profiling",
+        }
+
+    def dump(self, endpoint, directory=DEFAULT_DIR, formats=DEFAULT_FORMATS):
+        """Write the profile to `directory` and return the list of files written"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        millis = int(self.started_at * 1000) % 1000
+        base = os.path.join(directory, f"{endpoint or 'unknown'}-{stamp}.{millis:03d}-{self.thread_id}")
+        name = f"{endpoint} ({self.duration * 1000:.1f} ms, {self.samples} samples)"
+        written = []
+        if "collapsed" in formats:
+            with open(base + ".collapsed.txt", "w", encoding="utf-8") as fh:
+                fh.write(self.collapsed())
+            written.append(base + ".collapsed.txt")
+        if "speedscope" in formats:
+            with open(base + ".speedscope.json", "w", encoding="utf-8") as fh:
+                json.dump(self.speedscope(name), fh)
+            written.append(base + ".speedscope.json")
+        return written
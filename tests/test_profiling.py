@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import threading
+import importlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling
+
+
+def test_parse_sample_rates_skips_malformed_and_clamps():
+    rates = profiling.parse_sample_rates("generate_recipes:5, *:0.5,bad,x:y,,hi:250,lo:-3,nan:nan")
+    assert rates == {'generate_recipes': 5.0, '*': 0.5, 'hi': 100.0, 'lo': 0.0}
+
+
+def test_parse_interval_ms_falls_back_on_bad_values():
+    assert profiling.parse_interval_ms("2.5") == 2.5
+    for bad in (None, "", "abc", "0", "-1", "inf", "nan"):
+        assert profiling.parse_interval_ms(bad) == profiling.DEFAULT_INTERVAL_MS
+
+
+def test_load_config_defaults_and_bad_interval():
+    config = profiling.load_config({'PROFILE_INTERVAL_MS': 'fast'})
+    assert config['token'] == ''
+    assert config['allow_query'] is False
+    assert config['dir'] == profiling.DEFAULT_DIR
+    assert config['interval_ms'] == profiling.DEFAULT_INTERVAL_MS
+    assert config['formats'] == profiling.DEFAULT_FORMATS
+    assert config['sample_rates'] == {}
+
+
+def test_should_profile_token():
+    config = profiling.load_config({'PROFILE_TOKEN': 'secret'})
+    assert profiling.should_profile(config, 'index', {profiling.PROFILE_HEADER: 'secret'}, {})
+    assert not profiling.should_profile(config, 'index', {profiling.PROFILE_HEADER: 'wrong'}, {})
+    assert not profiling.should_profile(config, 'index', {}, {})
+
+
+def test_load_config_formats_validation():
+    config = profiling.load_config({'PROFILE_FORMATS': 'speedscope, bogus'})
+    assert config['formats'] == ['speedscope']
+    config = profiling.load_config({'PROFILE_FORMATS': 'speedscop,colapsed'})
+    assert config['formats'] == profiling.DEFAULT_FORMATS
+
+
+def test_should_profile_non_ascii_token_is_rejected():
+    config = profiling.load_config({'PROFILE_TOKEN': 'secret', 'PROFILE_ALLOW_QUERY': '1'})
+    # Werkzeug decodes headers as latin-1 and query values as UTF-8
+    assert not profiling.should_profile(config, 'index', {profiling.PROFILE_HEADER: '\xe9'}, {})
+    assert not profiling.should_profile(config, 'index', {}, {profiling.PROFILE_QUERY_ARG: 'é'})
+    config = profiling.load_config({'PROFILE_TOKEN': 'sécret'})
+    assert profiling.should_profile(config, 'index', {profiling.PROFILE_HEADER: 'sécret'}, {})
+
+
+def test_should_profile_query_flag_is_opt_in():
+    args = {profiling.PROFILE_QUERY_ARG: 'secret'}
+    config = profiling.load_config({'PROFILE_TOKEN': 'secret'})
+    assert not profiling.should_profile(config, 'index', {}, args)
+    config = profiling.load_config({'PROFILE_TOKEN': 'secret', 'PROFILE_ALLOW_QUERY': '1'})
+    assert profiling.should_profile(config, 'index', {}, args)
+    assert not profiling.should_profile(config, 'index', {}, {profiling.PROFILE_QUERY_ARG: 'wrong'})
+
+
+def test_should_profile_without_token_configured():
+    config = profiling.load_config({})
+    assert not profiling.should_profile(config, 'index', {profiling.PROFILE_HEADER: ''}, {})
+    assert not profiling.should_profile(config, 'index', {profiling.PROFILE_HEADER: 'anything'}, {})
+
+
+def test_should_profile_sample_rates():
+    config = profiling.load_config({'PROFILE_SAMPLE_RATES': 'generate_recipes:100,recommend:0,*:0'})
+    assert all(profiling.should_profile(config, 'generate_recipes', {}, {}) for _ in range(50))
+    assert not any(profiling.should_profile(config, 'recommend', {}, {}) for _ in range(50))
+    assert not any(profiling.should_profile(config, 'index', {}, {}) for _ in range(50))
+    config = profiling.load_config({'PROFILE_SAMPLE_RATES': '*:100'})
+    assert profiling.should_profile(config, 'index', {}, {})
+
+
+def busy_loop(stop):
+    total = 0
+    while not stop.is_set():
+        total += 1
+    return total
+
+
+def test_request_sampler_dumps_collapsed_and_speedscope(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    try:
+        sampler = profiling.RequestSampler(worker.ident, interval=0.001).start()
+        while sampler.samples < 10:
+            stop.wait(0.01)
+        sampler.stop()
+    finally:
+        stop.set()
+        worker.join()
+
+    written = sampler.dump('demo', str(tmp_path), ['collapsed', 'speedscope'])
+    collapsed_path, speedscope_path = written
+
+    with open(collapsed_path, encoding='utf-8') as fh:
+        collapsed = fh.read()
+    assert 'busy_loop' in collapsed
+    for line in collapsed.strip().splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert stack and int(count) > 0
+
+    with open(speedscope_path, encoding='utf-8') as fh:
+        data = json.load(fh)
+    frames = data['shared']['frames']
+    profile = data['profiles'][0]
+    assert profile['type'] == 'sampled'
+    assert profile['samples']
+    assert len(profile['samples']) == len(profile['weights'])
+    assert all(0 <= i < len(frames) for stack in profile['samples'] for i in stack)
+    # Weights are measured gaps, so they add up to roughly the wall-clock duration
+    assert 0 < profile['endValue'] <= sampler.duration * 1000 + 1
+
+
+def test_query_flag_through_app_writes_profile(tmp_path, monkeypatch):
+    for module in ('flask', 'dotenv', 'langchain', 'langchain_groq', 'pandas', 'sklearn'):
+        pytest.importorskip(module)
+    import dotenv
+
+    # PROFILE_* values only exist once load_dotenv() runs, like a real .env
+    def fake_load_dotenv(*args, **kwargs):
+        monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+        monkeypatch.setenv('PROFILE_ALLOW_QUERY', '1')
+        monkeypatch.setenv('PROFILE_DIR', str(tmp_path))
+        return True
+
+    for name in ('PROFILE_TOKEN', 'PROFILE_ALLOW_QUERY', 'PROFILE_DIR'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    monkeypatch.setattr(dotenv, 'load_dotenv', fake_load_dotenv)
+    monkeypatch.delitem(sys.modules, 'app', raising=False)
+    app_module = importlib.import_module('app')
+    monkeypatch.delitem(sys.modules, 'app')
+
+    app_module.app.testing = True
+    client = app_module.app.test_client()
+
+    assert client.get('/about').status_code == 200
+    assert os.listdir(tmp_path) == []
+
+    assert client.get('/about?_profile=secret').status_code == 200
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 2
+    assert files[0].startswith('about-') and files[0].endswith('.collapsed.txt')
+    assert files[1].startswith('about-') and files[1].endswith('.speedscope.json')
+
+    response = client.get('/about', headers={'X-Profile-Token': '\xe9'})
+    assert response.status_code == 200
+    assert client.get('/about?_profile=%C3%A9').status_code == 200
+    assert len(os.listdir(tmp_path)) == 2